@@ -7,20 +7,25 @@ import contextlib
 import json
 import os
 import random
+import re
 import shutil
 import sys
 import textwrap
 import threading
+from collections.abc import Callable
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from email.utils import parsedate_to_datetime
+from html import unescape
 from urllib.parse import urljoin
 
 import aiohttp
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from tqdm import tqdm
 
-from utils.decode import decode_pages
+from utils import fastjson
+from utils.cache import fetch_text_cached, url_cache_path
+from utils.decode import decode_pages, prewarm_destring
 from utils.pdf import PDFBuildCancelled, build_pdf_from_images
 from utils.text import clean_description, sanitize_filename, short_label
 from utils.url import normalize_share_url
@@ -31,11 +36,49 @@ DEFAULT_UA = (
 )
 DEFAULT_SIZE = "large"
 REQUEST_TIMEOUT = 30
+CONNECTOR_DNS_TTL = 300
+CONNECTOR_KEEPALIVE = 60
 DOWNLOAD_MAX_ATTEMPTS = 16
 DOWNLOAD_BACKOFF_BASE = 0.4
 DOWNLOAD_BACKOFF_MAX = 5.0
 DOWNLOAD_BACKOFF_JITTER = 0.2
+DOWNLOAD_BACKOFF_STEPS = tuple(
+    min(DOWNLOAD_BACKOFF_BASE * 2**step, DOWNLOAD_BACKOFF_MAX)
+    for step in range(DOWNLOAD_MAX_ATTEMPTS)
+)
 RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+BOOK_META_TAGS = SoupStrainer(["title", "meta"])
+CONFIG_SCRIPTS = SoupStrainer("script", src=True)
+CONFIG_JS_PATH = "javascript/config.js"
+SCRIPT_SRC_RE = re.compile(r"""\ssrc\s*=\s*(["']?)([^"'\s>]+)\1""", re.IGNORECASE)
+RANGE_SPLIT_THRESHOLD = 2 * 1024 * 1024
+RANGE_PARTS = 4
+FIRST_RANGE_HEADERS = {"Range": f"bytes=0-{RANGE_SPLIT_THRESHOLD - 1}"}
+
+
+def _needs_urljoin(path: str) -> bool:
+    """Return True when urljoin would rewrite ``path`` instead of appending it.
+
+    urljoin resolves ``.``/``..`` segments and drops empty ones.
+    """
+    if path.startswith("/") or "//" in path:
+        return True
+    if "/." not in f"/{path}":
+        return False
+    return any(seg in {".", ".."} for seg in path.split("/"))
+
+
+def _page_filename(page) -> str | None:
+    """Return the image filename of a config page entry."""
+    if isinstance(page, str):
+        return page
+    if isinstance(page, dict):
+        n = page.get("n")
+        if isinstance(n, list) and n:
+            return n[0]
+        if isinstance(n, str):
+            return n
+    return None
 
 
 @dataclass(slots=True)
@@ -46,6 +89,8 @@ class DownloaderOptions:
     workers: int = 6
     overwrite: bool = False
     pdf: str = ""
+    save_config: bool = False
+    keep_pages: bool = False
 
 
 @dataclass(slots=True)
@@ -69,6 +114,8 @@ class FlipHTML5Downloader:
         self.workers = opts.workers
         self.overwrite = opts.overwrite
         self.pdf = opts.pdf
+        self.save_config = opts.save_config
+        self.keep_pages = opts.keep_pages
 
     async def run(self) -> int:
         """Execute download flow. Returns process exit code."""
@@ -77,7 +124,15 @@ class FlipHTML5Downloader:
             return 2
 
         timeout = self._build_timeout()
-        connector = aiohttp.TCPConnector(limit=max(self.workers * 2, 20))
+        # Each worker may hold RANGE_PARTS connections while a large page is
+        # fetched in ranges; every page comes from the same host.
+        pool_size = max(self.workers * RANGE_PARTS, 20)
+        connector = aiohttp.TCPConnector(
+            limit=pool_size,
+            limit_per_host=pool_size,
+            ttl_dns_cache=CONNECTOR_DNS_TTL,
+            keepalive_timeout=CONNECTOR_KEEPALIVE,
+        )
         async with aiohttp.ClientSession(
             headers={"User-Agent": DEFAULT_UA},
             timeout=timeout,
@@ -111,23 +166,66 @@ class FlipHTML5Downloader:
         base_url: str,
         session: aiohttp.ClientSession,
     ) -> int:
+        prewarm_destring(session)
         prepared = await self._prepare_book_data(base_url, session)
         if prepared is None:
             return 2
 
+        try:
+            return await self._download_and_build(session, prepared)
+        finally:
+            if not self.keep_pages:
+                shutil.rmtree(prepared.pages_dir, ignore_errors=True)
+                # Drop <out>/_pages too unless other books' kept pages remain.
+                with contextlib.suppress(OSError):
+                    os.rmdir(os.path.dirname(prepared.pages_dir))
+
+    async def _download_and_build(
+        self,
+        session: aiohttp.ClientSession,
+        prepared: PreparedBook,
+    ) -> int:
+        """Download pages while the PDF is assembled from those already done."""
+        page_ready = {task[0]: threading.Event() for task in prepared.tasks if task[2]}
+        show_progress = threading.Event()
+        build_task = asyncio.create_task(
+            self._create_pdf(prepared, page_ready, show_progress)
+        )
+        stop_requested = False
+
+        def stop_build() -> None:
+            # Cancel once: a second cancel would interrupt _create_pdf while
+            # it waits for the build thread to stop.
+            nonlocal stop_requested
+            if not stop_requested:
+                stop_requested = True
+                build_task.cancel()
+
+        def on_page(idx: int, status: str) -> None:
+            if status in {"ok", "skip"}:
+                page_ready[idx].set()
+            else:
+                stop_build()
+
         try:
             _ok, _skipped, failed = await self._download_pages(
-                session, prepared.tasks, prepared.pages_dir
+                session, prepared.tasks, prepared.pages_dir, on_page
             )
-            if failed > 0:
-                print(
-                    "error: some pages failed to download; PDF not created",
-                    file=sys.stderr,
-                )
-                return 2
-            return await self._create_pdf(prepared)
-        finally:
-            shutil.rmtree(prepared.pages_dir, ignore_errors=True)
+        except BaseException:
+            stop_build()
+            await asyncio.gather(build_task, return_exceptions=True)
+            raise
+        if failed > 0:
+            stop_build()
+            await asyncio.gather(build_task, return_exceptions=True)
+            print(
+                "error: some pages failed to download; PDF not created",
+                file=sys.stderr,
+            )
+            return 2
+        print("Creating PDF...")
+        show_progress.set()
+        return await build_task
 
     async def _prepare_book_data(
         self,
@@ -141,16 +239,19 @@ class FlipHTML5Downloader:
         config = await self._load_book_config(base_url, html, session)
         if config is None:
             return None
+        if self.save_config:
+            self._write_config(config)
 
         pages = await self._decode_book_pages(config, session)
         if pages is None:
             return None
 
-        meta = self._extract_metadata(html)
+        soup = BeautifulSoup(html, "lxml", parse_only=BOOK_META_TAGS)
+        meta = self._extract_metadata(soup)
         title = meta.get("title")
         description = meta.get("description")
         self._print_book_info(title, description, len(pages))
-        pages_dir = os.path.join(self.out, "_pages")
+        pages_dir = self._book_pages_dir(base_url)
         tasks = self._build_download_tasks(base_url, pages, self.size)
         return PreparedBook(
             title=title,
@@ -159,6 +260,18 @@ class FlipHTML5Downloader:
             tasks=tasks,
         )
 
+    def _book_pages_dir(self, base_url: str) -> str:
+        """Return ``<out>/_pages/<publisher>_<book>`` for this book.
+
+        Kept pages are matched by file name only, so each book needs its own
+        folder or a later book would pick up another book's pages.
+        """
+        publisher, _, book = base_url.rstrip("/").rpartition("/")
+        publisher = publisher.rpartition("/")[2]
+        return os.path.join(
+            self.out, "_pages", sanitize_filename(f"{publisher}_{book}")
+        )
+
     async def _load_book_html(
         self,
         base_url: str,
@@ -177,7 +290,7 @@ class FlipHTML5Downloader:
         session: aiohttp.ClientSession,
     ) -> dict | None:
         config_url = (
-            self._find_config_url(html, base_url) or f"{base_url}javascript/config.js"
+            self._find_config_url(html, base_url) or f"{base_url}{CONFIG_JS_PATH}"
         )
         try:
             return await self._fetch_config(config_url, session)
@@ -189,6 +302,17 @@ class FlipHTML5Downloader:
             print(f"error: failed to fetch/parse config: {exc}", file=sys.stderr)
             return None
 
+    def _write_config(self, config: dict) -> None:
+        config_path = os.path.join(self.out, "config.json")
+        try:
+            os.makedirs(self.out, exist_ok=True)
+            with open(config_path, "wb") as f:
+                f.write(fastjson.dumps_pretty(config))
+        except OSError as exc:
+            print(f"warning: failed to save config: {exc}", file=sys.stderr)
+            return
+        print(f"Config: {config_path}")
+
     async def _decode_book_pages(
         self,
         config: dict,
@@ -207,15 +331,17 @@ class FlipHTML5Downloader:
             return None
         return pages
 
-    async def _create_pdf(self, prepared: PreparedBook) -> int:
+    async def _create_pdf(
+        self,
+        prepared: PreparedBook,
+        page_ready: dict[int, threading.Event],
+        show_progress: threading.Event | None = None,
+    ) -> int:
         pdf_name = self.output_pdf_path(prepared.title)
-        image_paths = [
-            os.path.join(prepared.pages_dir, task[2])
-            for task in prepared.tasks
-            if task[2]
-        ]
+        pages = [task for task in prepared.tasks if task[2]]
+        image_paths = [os.path.join(prepared.pages_dir, task[2]) for task in pages]
+        ready_events = [page_ready[task[0]] for task in pages]
         try:
-            print("Creating PDF...")
             loop = asyncio.get_running_loop()
             cancel_event = threading.Event()
             build_future = loop.run_in_executor(
@@ -226,15 +352,14 @@ class FlipHTML5Downloader:
                 prepared.title,
                 prepared.description,
                 cancel_event,
+                ready_events,
+                show_progress,
             )
             await asyncio.shield(build_future)
         except asyncio.CancelledError:
             cancel_event.set()
             with contextlib.suppress(Exception):
                 await asyncio.shield(build_future)
-            if os.path.exists(pdf_name):
-                with contextlib.suppress(OSError):
-                    os.remove(pdf_name)
             raise
         except PDFBuildCancelled:
             print("error: PDF build cancelled", file=sys.stderr)
@@ -247,12 +372,9 @@ class FlipHTML5Downloader:
         return 0
 
     async def _fetch_html(self, url: str, session: aiohttp.ClientSession) -> str:
-        async with session.get(url) as resp:
-            resp.raise_for_status()
-            return await resp.text()
+        return await fetch_text_cached(session, url, url_cache_path(url, ".html"))
 
-    def _extract_metadata(self, html: str) -> dict:
-        soup = BeautifulSoup(html, "html.parser")
+    def _extract_metadata(self, soup: BeautifulSoup) -> dict:
         meta: dict[str, str] = {}
 
         title_tag = soup.find("title")
@@ -285,65 +407,82 @@ class FlipHTML5Downloader:
         return {"title": title, "description": description, "raw": meta}
 
     def _find_config_url(self, html: str, base_url: str) -> str | None:
-        soup = BeautifulSoup(html, "html.parser")
-        for script in soup.find_all("script", src=True):
-            src = script.get("src", "")
-            if "javascript/config.js" in src:
-                return urljoin(base_url, src)
-        return None
+        idx = html.find(CONFIG_JS_PATH)
+        if idx < 0:
+            return None
+        src = self._script_src_at(html, idx)
+        if src is None:
+            # The first mention is not a plain <script src>; scan every tag.
+            soup = BeautifulSoup(html, "lxml", parse_only=CONFIG_SCRIPTS)
+            src = next(
+                (
+                    script["src"]
+                    for script in soup.find_all("script", src=True)
+                    if CONFIG_JS_PATH in script["src"]
+                ),
+                None,
+            )
+        return urljoin(base_url, src) if src else None
+
+    def _script_src_at(self, html: str, idx: int) -> str | None:
+        """Return the src of the <script> tag enclosing ``html[idx]``, if any."""
+        start = html.rfind("<", 0, idx)
+        end = html.find(">", idx)
+        if start < 0 or end < 0 or html[start : start + 7].lower() != "<script":
+            return None
+        match = SCRIPT_SRC_RE.search(html, start, end)
+        if match is None or CONFIG_JS_PATH not in match.group(2):
+            return None
+        return unescape(match.group(2))
 
     async def _fetch_config(
         self, config_url: str, session: aiohttp.ClientSession
     ) -> dict:
-        async with session.get(config_url) as resp:
-            resp.raise_for_status()
-            text = (await resp.text()).strip()
+        cache_path = url_cache_path(config_url, ".config.js")
+        text = (await fetch_text_cached(session, config_url, cache_path)).strip()
         if text.startswith("var htmlConfig = "):
             text = text[len("var htmlConfig = ") :]
         if text.endswith(";"):
             text = text[:-1]
-        return json.loads(text)
+        return fastjson.loads(text)
 
     def _build_download_tasks(self, base_url: str, pages, size: str):
+        files_root = urljoin(base_url, "files/")
+        size_root = urljoin(files_root, f"{size}/")
         tasks = []
-        for idx, page in enumerate(pages):
-            filename = None
-            if isinstance(page, str):
-                filename = page
-            elif isinstance(page, dict):
-                n = page.get("n")
-                if isinstance(n, list) and n:
-                    filename = n[0]
-                elif isinstance(n, str):
-                    filename = n
+        for idx, filename in enumerate(map(_page_filename, pages)):
             if not filename:
                 tasks.append((idx, None, None))
                 continue
-            url = self._build_page_url(base_url, filename, size)
+            url = self._build_page_url(filename, files_root, size_root)
             out_name = self._safe_output_name(idx, filename)
             tasks.append((idx, url, out_name))
         return tasks
 
     def _safe_output_name(self, idx: int, filename: str) -> str | None:
-        leaf = filename.replace("\\", "/").rsplit("/", 1)[-1]
-        leaf = leaf.split("?", 1)[0].split("#", 1)[0]
+        leaf = filename.rpartition("/")[2].rpartition("\\")[2]
+        leaf = leaf.partition("?")[0].partition("#")[0]
         safe_leaf = sanitize_filename(leaf)
         if safe_leaf in {"", ".", ".."}:
             return None
         return f"{idx+1:03d}_{safe_leaf}"
 
-    def _build_page_url(self, base_url: str, filename: str, size: str) -> str:
-        """Build a valid page URL from a filename or relative path."""
-        if filename.startswith("http://") or filename.startswith("https://"):
+    def _build_page_url(self, filename: str, files_root: str, size_root: str) -> str:
+        """Build a valid page URL from a filename or relative path.
+
+        ``files_root`` and ``size_root`` are the book's ``files/`` and
+        ``files/<size>/`` URLs, resolved once per book.
+        """
+        if filename.startswith(("http://", "https://")):
             return filename
-        path = filename
-        if path.startswith("./"):
-            path = path[2:]
-        if path.startswith("/"):
-            path = path[1:]
+        path = filename.removeprefix("./").removeprefix("/")
+        root = size_root
         if path.startswith("files/"):
-            return urljoin(base_url, path)
-        return urljoin(base_url, f"files/{size}/{path}")
+            root = files_root
+            path = path[len("files/") :]
+        if _needs_urljoin(path):
+            return urljoin(root, path.lstrip("/"))
+        return root + path
 
     async def _download_one(
         self,
@@ -351,16 +490,13 @@ class FlipHTML5Downloader:
         url: str,
         out_path: str,
     ) -> str:
-        if not self.overwrite and os.path.exists(out_path):
-            return "skip"
         tmp_path = f"{out_path}.part"
+        done = False
+        headers = FIRST_RANGE_HEADERS
         for attempt in range(1, DOWNLOAD_MAX_ATTEMPTS + 1):
             try:
-                out_dir = os.path.dirname(out_path)
-                if out_dir:
-                    os.makedirs(out_dir, exist_ok=True)
-                async with session.get(url) as resp:
-                    if resp.status != 200:
+                async with session.get(url, headers=headers) as resp:
+                    if resp.status not in (200, 206):
                         if (
                             self._is_retryable_status(resp.status)
                             and attempt < DOWNLOAD_MAX_ATTEMPTS
@@ -371,12 +507,34 @@ class FlipHTML5Downloader:
                             continue
                         return f"fail:{resp.status}"
 
+                    total = None
+                    if resp.status == 206:
+                        # Only a range from byte 0 of a known total can be
+                        # completed; otherwise fetch the whole object instead.
+                        content_range = self._parse_content_range(
+                            resp.headers.get("Content-Range")
+                        )
+                        if content_range is None or content_range[0] != 0:
+                            if headers is None:
+                                return "fail:bad_range"
+                            headers = None
+                            continue
+                        total = content_range[2]
                     with open(tmp_path, "wb") as f:
-                        async for chunk in resp.content.iter_chunked(1024 * 1024):
-                            if chunk:
-                                f.write(chunk)
-                    os.replace(tmp_path, out_path)
-                    return "ok"
+                        self._preallocate(f, total or resp.content_length)
+                        received = await self._write_body(resp, f)
+                        if total is None:
+                            f.truncate()
+
+                if total is not None and received < total:
+                    status = await self._download_ranges(
+                        session, url, tmp_path, received, total
+                    )
+                    if status != "ok":
+                        return status
+                os.replace(tmp_path, out_path)
+                done = True
+                return "ok"
             except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
                 if attempt < DOWNLOAD_MAX_ATTEMPTS:
                     delay = self._compute_backoff_delay(attempt, None)
@@ -386,11 +544,108 @@ class FlipHTML5Downloader:
             except OSError as exc:
                 return f"fail:{exc.__class__.__name__}"
             finally:
-                if os.path.exists(tmp_path):
+                if not done:
                     with contextlib.suppress(OSError):
                         os.remove(tmp_path)
         return "fail:max_retries"
 
+    async def _write_body(self, resp: aiohttp.ClientResponse, f) -> int:
+        written = 0
+        async for chunk in resp.content.iter_any():
+            f.write(chunk)
+            written += len(chunk)
+        return written
+
+    def _preallocate(self, f, size: int | None) -> None:
+        """Reserve ``size`` bytes for ``f`` up front where the OS supports it."""
+        if not size or not hasattr(os, "posix_fallocate"):
+            return
+        with contextlib.suppress(OSError):
+            os.posix_fallocate(f.fileno(), 0, size)
+
+    async def _download_ranges(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        tmp_path: str,
+        start: int,
+        total: int,
+    ) -> str:
+        """Fetch bytes ``start..total-1`` as parallel ranges into ``tmp_path``."""
+        remaining = total - start
+        part_size = -(-remaining // RANGE_PARTS)
+        spans = [
+            (offset, min(offset + part_size, total) - 1)
+            for offset in range(start, total, part_size)
+        ]
+        results = await asyncio.gather(
+            *(
+                self._download_range(session, url, tmp_path, first, last)
+                for first, last in spans
+            )
+        )
+        for status in results:
+            if status != "ok":
+                return status
+        return "ok"
+
+    async def _download_range(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        tmp_path: str,
+        first: int,
+        last: int,
+    ) -> str:
+        headers = {"Range": f"bytes={first}-{last}"}
+        for attempt in range(1, DOWNLOAD_MAX_ATTEMPTS + 1):
+            try:
+                async with session.get(url, headers=headers) as resp:
+                    if resp.status != 206:
+                        if (
+                            self._is_retryable_status(resp.status)
+                            and attempt < DOWNLOAD_MAX_ATTEMPTS
+                        ):
+                            retry_after = resp.headers.get("Retry-After")
+                            delay = self._compute_backoff_delay(attempt, retry_after)
+                            await asyncio.sleep(delay)
+                            continue
+                        return f"fail:{resp.status}"
+                    content_range = self._parse_content_range(
+                        resp.headers.get("Content-Range")
+                    )
+                    if content_range is None or content_range[0] != first:
+                        return "fail:bad_range"
+                    with open(tmp_path, "r+b") as f:
+                        f.seek(first)
+                        received = await self._write_body(resp, f)
+                if received != last - first + 1:
+                    return "fail:short_range"
+                return "ok"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                if attempt < DOWNLOAD_MAX_ATTEMPTS:
+                    delay = self._compute_backoff_delay(attempt, None)
+                    await asyncio.sleep(delay)
+                    continue
+                return f"fail:{exc.__class__.__name__}"
+            except OSError as exc:
+                return f"fail:{exc.__class__.__name__}"
+        return "fail:max_retries"
+
+    def _parse_content_range(self, raw: str | None) -> tuple[int, int, int] | None:
+        """Parse ``bytes first-last/total``; None when absent or unknown size."""
+        if not raw:
+            return None
+        unit, _, spec = raw.strip().partition(" ")
+        if unit.lower() != "bytes":
+            return None
+        span, _, size = spec.partition("/")
+        first, _, last = span.partition("-")
+        try:
+            return int(first), int(last), int(size)
+        except ValueError:
+            return None
+
     def _is_retryable_status(self, status: int) -> bool:
         return status in RETRYABLE_STATUS
 
@@ -403,8 +658,8 @@ class FlipHTML5Downloader:
         if delay is not None:
             return min(delay, DOWNLOAD_BACKOFF_MAX)
 
-        backoff = DOWNLOAD_BACKOFF_BASE * (2 ** (attempt - 1))
-        jitter = random.uniform(0.0, DOWNLOAD_BACKOFF_JITTER)
+        backoff = DOWNLOAD_BACKOFF_STEPS[min(attempt, DOWNLOAD_MAX_ATTEMPTS) - 1]
+        jitter = random.random() * DOWNLOAD_BACKOFF_JITTER
         return min(backoff + jitter, DOWNLOAD_BACKOFF_MAX)
 
     def _parse_retry_after(self, raw: str | None) -> float | None:
@@ -443,12 +698,20 @@ class FlipHTML5Downloader:
         session: aiohttp.ClientSession,
         tasks,
         pages_dir: str,
+        on_page: Callable[[int, str], None] | None = None,
     ) -> tuple[int, int, int]:
         total = len(tasks)
         ok = 0
         skipped = 0
         failed = 0
         semaphore = asyncio.Semaphore(max(self.workers, 1))
+        try:
+            os.makedirs(pages_dir, exist_ok=True)
+            with os.scandir(pages_dir) as entries:
+                existing = {entry.name for entry in entries if entry.is_file()}
+        except OSError as exc:
+            print(f"error: failed to prepare pages folder: {exc}", file=sys.stderr)
+            return ok, skipped, total
 
         async def worker(task):
             idx, url, out_name = task
@@ -457,6 +720,8 @@ class FlipHTML5Downloader:
             out_path = self._resolve_output_path(pages_dir, out_name)
             if out_path is None:
                 return idx, "fail:unsafe_path", out_name
+            if not self.overwrite and out_name in existing:
+                return idx, "skip", out_name
             async with semaphore:
                 status = await self._download_one(session, url, out_path)
             return idx, status, out_name
@@ -466,7 +731,9 @@ class FlipHTML5Downloader:
         try:
             with tqdm(total=total, desc="download", unit="page", leave=False) as pbar:
                 for fut in asyncio.as_completed(futures):
-                    _, status, out_name = await fut
+                    idx, status, out_name = await fut
+                    if on_page is not None:
+                        on_page(idx, status)
                     pbar.set_description_str(short_label(out_name))
                     if status == "ok":
                         ok += 1
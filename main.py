@@ -6,9 +6,19 @@ from __future__ import annotations
 import argparse
 import asyncio
 import sys
+from collections.abc import Coroutine
+from typing import Any
 
 from downloader import DownloaderOptions, FlipHTML5Downloader
 
+try:
+    if sys.platform == "win32":
+        import winloop as fast_loop
+    else:
+        import uvloop as fast_loop
+except ImportError:  # pragma: no cover - stock asyncio loop is used
+    fast_loop = None
+
 
 def build_parser() -> argparse.ArgumentParser:
     """Create CLI argument parser."""
@@ -30,6 +40,16 @@ def build_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "--pdf", default="", help="Output PDF path (default: <out>/<title>.pdf)"
     )
+    parser.add_argument(
+        "--save-config",
+        action="store_true",
+        help="Save the book config as <out>/config.json",
+    )
+    parser.add_argument(
+        "--keep-pages",
+        action="store_true",
+        help="Keep downloaded page images in <out>/_pages/<publisher>_<book>",
+    )
     return parser
 
 
@@ -54,10 +74,29 @@ def _prompt_yes_no(prompt: str, *, default: bool = True) -> bool:
         print("Please answer with 'y' or 'n'.")
 
 
+def _run_async(coro: Coroutine[Any, Any, int]) -> int:
+    """Run a coroutine on a fresh event loop.
+
+    The loop is uvloop (winloop on Windows) when installed, and tasks start
+    eagerly on Python 3.12+, so page workers that return straight away for
+    already-downloaded files finish without waiting for a loop iteration.
+    """
+    if not hasattr(asyncio, "Runner"):  # Python 3.10
+        if fast_loop is not None:
+            asyncio.set_event_loop_policy(fast_loop.EventLoopPolicy())
+        return asyncio.run(coro)
+    loop_factory = fast_loop.new_event_loop if fast_loop is not None else None
+    eager_factory = getattr(asyncio, "eager_task_factory", None)
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        if eager_factory is not None:
+            runner.get_loop().set_task_factory(eager_factory)
+        return runner.run(coro)
+
+
 def _run_downloader(downloader: FlipHTML5Downloader) -> int:
     """Run downloader coroutine and handle Ctrl+C without traceback."""
     try:
-        return asyncio.run(downloader.run())
+        return _run_async(downloader.run())
     except KeyboardInterrupt:
         print("\nDownload cancelled.", file=sys.stderr)
         return 130
@@ -72,6 +111,8 @@ def _make_downloader(url: str, args: argparse.Namespace) -> FlipHTML5Downloader:
         workers=args.workers,
         overwrite=args.overwrite,
         pdf=args.pdf,
+        save_config=args.save_config,
+        keep_pages=args.keep_pages,
     )
     return FlipHTML5Downloader(url=url, options=options)
 
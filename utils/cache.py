@@ -0,0 +1,111 @@
+"""On-disk cache helpers."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import os
+import stat
+from datetime import timezone
+from email.utils import formatdate, parsedate_to_datetime
+
+import aiohttp
+
+
+def cache_dir(*parts: str) -> str:
+    """Return a folder under ``./.cache``, creating it when missing."""
+    path = os.path.join(os.getcwd(), ".cache", *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def private_cache_dir() -> str:
+    """Return the per-user flipdl cache folder, readable only by this user.
+
+    Files that are trusted when loaded back, such as precompiled native
+    code, belong here rather than in ``./.cache``. Raises ``OSError`` when
+    the folder cannot be made private.
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or ""
+        if not os.path.isabs(base):
+            base = os.path.join(os.path.expanduser("~"), "AppData", "Local")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or ""
+        if not os.path.isabs(base):
+            base = os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(base, "flipdl")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if os.name != "nt":
+        st = os.lstat(path)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+            raise OSError(f"cache folder is not owned by the current user: {path}")
+        if st.st_mode & 0o077:
+            os.chmod(path, 0o700)
+    return path
+
+
+def url_cache_path(url: str, suffix: str) -> str:
+    """Return the cache file path for a fetched URL."""
+    key = hashlib.blake2b(url.encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(os.getcwd(), ".cache", "books", f"{key}{suffix}")
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Write ``data`` to ``path`` through a temporary file and rename."""
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+
+
+async def fetch_text_cached(session: aiohttp.ClientSession, url: str, path: str) -> str:
+    """GET ``url`` as text, revalidating a cached copy with If-Modified-Since.
+
+    The cache file mtime holds the response ``Last-Modified`` time; responses
+    without that header are not cached.
+    """
+    # File I/O runs on the default executor so it never blocks the loop.
+    loop = asyncio.get_running_loop()
+    cached = await loop.run_in_executor(None, _read_cached, path)
+    headers = {}
+    if cached is not None:
+        headers["If-Modified-Since"] = formatdate(cached[1], usegmt=True)
+    async with session.get(url, headers=headers) as resp:
+        if resp.status == 304 and cached is not None:
+            return cached[0]
+        resp.raise_for_status()
+        text = await resp.text()
+        last_modified = resp.headers.get("Last-Modified")
+    await loop.run_in_executor(None, _store_cached, path, text, last_modified)
+    return text
+
+
+def _read_cached(path: str) -> tuple[str, float] | None:
+    try:
+        mtime = os.stat(path).st_mtime
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read(), mtime
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _store_cached(path: str, text: str, last_modified: str | None) -> None:
+    if not last_modified:
+        return
+    try:
+        dt = parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError):
+        return
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    stamp = dt.timestamp()
+    with contextlib.suppress(OSError):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, text.encode("utf-8"))
+        os.utime(path, (stamp, stamp))
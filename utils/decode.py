@@ -4,17 +4,27 @@ from __future__ import annotations
 
 import asyncio
 import base64
+import contextlib
+import ctypes
+import functools
+import hashlib
 import json
 import os
 import re
+import struct
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from importlib import metadata
 
 import aiohttp
 
+from utils import fastjson
+from utils.cache import atomic_write, cache_dir, private_cache_dir
+
 try:
-    from wasmtime import Linker, Module, Store, WasmtimeError
+    from wasmtime import Config, Engine, Linker, Module, Store, WasmtimeError
 except ImportError:  # pragma: no cover - handled at runtime with clear error
-    Linker = Module = Store = None
+    Config = Engine = Linker = Module = Store = None
 
     class WasmtimeError(Exception):
         """Fallback error type when wasmtime is unavailable."""
@@ -25,13 +35,50 @@ DESTRING_URL = (
 )
 DESTRING_WASM_RE = re.compile(r"data:application/octet-stream;base64,([A-Za-z0-9+/=]+)")
 WASM_PAGE_SIZE = 65536
+WASM_MAGIC = b"\x00asm"
+C_STRING_SCAN_CHUNK = 4096
+C_STRING_MAX_LEN = 16 * 1024 * 1024
 
 _RUNTIME_CACHE: dict[str, "_DeStringRuntime"] = {}
+_ENGINE: "Engine | None" = None
+_PREWARM_TASK: "asyncio.Task[_DeStringRuntime] | None" = None
+# A wasmtime Store must not be used from several threads at once, so runtime
+# setup and every decode run on this one thread.
+_DESTRING_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="destring")
+
+
+def prewarm_destring(session: aiohttp.ClientSession) -> None:
+    """Start fetching deString.js and building its runtime in the background.
+
+    ``destring`` awaits this task instead of loading the runtime itself, so
+    the work overlaps with fetching the book HTML and config.
+    """
+    global _PREWARM_TASK
+    loop = asyncio.get_running_loop()
+    if _PREWARM_TASK is not None and _PREWARM_TASK.get_loop() is loop:
+        return
+    _PREWARM_TASK = loop.create_task(_load_runtime(session))
+    _PREWARM_TASK.add_done_callback(_consume_prewarm_result)
+
+
+def _consume_prewarm_result(task: asyncio.Task) -> None:
+    # Books without encrypted pages never await the task; mark its error as
+    # retrieved so asyncio does not log it.
+    if not task.cancelled():
+        task.exception()
+
+
+async def _load_runtime(session: aiohttp.ClientSession) -> "_DeStringRuntime":
+    js_path = await ensure_destring_js(session)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_DESTRING_EXECUTOR, get_runtime, js_path)
 
 
-def _decode_with_runtime(js_path: str, value: str) -> str:
-    runtime = get_runtime(js_path)
-    return runtime.decode(value)
+async def _runtime_for(session: aiohttp.ClientSession) -> "_DeStringRuntime":
+    task = _PREWARM_TASK
+    if task is not None and task.get_loop() is asyncio.get_running_loop():
+        return await task
+    return await _load_runtime(session)
 
 
 async def decode_pages(pages_raw, session: aiohttp.ClientSession) -> list | None:
@@ -52,37 +99,60 @@ async def decode_pages(pages_raw, session: aiohttp.ClientSession) -> list | None
 def parse_pages_json(text: str) -> list | None:
     """Parse a JSON array, tolerating extra prefix/suffix text."""
     raw = text.strip()
+    # Slice to the outermost brackets first so text with a prefix or suffix
+    # is parsed once instead of failing a full parse before the retry.
+    start = raw.find("[")
+    end = raw.rfind("]")
+    if start == -1 or end <= start:
+        return None
     try:
-        data = json.loads(raw)
+        data = fastjson.loads(raw[start : end + 1])
     except json.JSONDecodeError:
-        start = raw.find("[")
-        end = raw.rfind("]")
-        if start == -1 or end == -1 or end <= start:
-            return None
-        try:
-            data = json.loads(raw[start : end + 1])
-        except json.JSONDecodeError:
-            return None
+        return None
     return data if isinstance(data, list) else None
 
 
 async def ensure_destring_js(session: aiohttp.ClientSession) -> str:
     """Download and cache deString.js for decoding."""
-    cache_dir = os.path.join(os.getcwd(), ".cache")
-    os.makedirs(cache_dir, exist_ok=True)
-    js_path = os.path.join(cache_dir, "deString.js")
+    js_path = os.path.join(cache_dir(), "deString.js")
     if os.path.exists(js_path) and os.path.getsize(js_path) > 0:
         return js_path
     async with session.get(DESTRING_URL) as resp:
         resp.raise_for_status()
         content = await resp.read()
-    with open(js_path, "wb") as f:
-        f.write(content)
+    # Write through a temp file off the loop so an interrupted write never
+    # leaves a truncated script that the size check above would accept.
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, atomic_write, js_path, content)
     return js_path
 
 
 def extract_wasm_from_js(js_path: str) -> bytes:
-    """Extract embedded WASM bytes from deString.js."""
+    """Extract embedded WASM bytes from deString.js.
+
+    Results are memoized per file version and kept in a ``.wasm`` file next
+    to the script, so the script is only searched and base64-decoded again
+    when it changes.
+    """
+    return _wasm_bytes_for(js_path, os.stat(js_path).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=4)
+def _wasm_bytes_for(js_path: str, mtime_ns: int) -> bytes:
+    wasm_path = os.path.splitext(js_path)[0] + ".wasm"
+    with contextlib.suppress(OSError):
+        if os.stat(wasm_path).st_mtime_ns >= mtime_ns:
+            with open(wasm_path, "rb") as f:
+                wasm_bytes = f.read()
+            if wasm_bytes.startswith(WASM_MAGIC):
+                return wasm_bytes
+    wasm_bytes = _decode_wasm_from_js(js_path)
+    with contextlib.suppress(OSError):
+        atomic_write(wasm_path, wasm_bytes)
+    return wasm_bytes
+
+
+def _decode_wasm_from_js(js_path: str) -> bytes:
     with open(js_path, "r", encoding="utf-8", errors="replace") as f:
         code = f.read()
     match = DESTRING_WASM_RE.search(code)
@@ -91,12 +161,54 @@ def extract_wasm_from_js(js_path: str) -> bytes:
     return base64.b64decode(match.group(1))
 
 
+def _engine() -> "Engine":
+    """Return the process-wide wasmtime engine shared by all runtimes."""
+    global _ENGINE
+    if _ENGINE is None:
+        config = Config()
+        config.cranelift_opt_level = "speed"
+        config.parallel_compilation = True
+        _ENGINE = Engine(config)
+    return _ENGINE
+
+
+def _wasmtime_version() -> str:
+    try:
+        return metadata.version("wasmtime")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _load_module(engine, wasm_bytes: bytes):
+    """Return a compiled module, reusing a precompiled copy cached on disk.
+
+    The cache file is keyed by the wasm digest and the wasmtime version, so a
+    new deString build or wasmtime upgrade compiles again. Deserializing runs
+    the file as native code without validation, so it lives in the private
+    per-user cache folder, never in the working directory.
+    """
+    digest = hashlib.sha256(wasm_bytes).hexdigest()[:16]
+    try:
+        cwasm_path = os.path.join(
+            private_cache_dir(), f"deString-{digest}-{_wasmtime_version()}.cwasm"
+        )
+    except OSError:
+        return Module(engine, wasm_bytes)
+    if os.path.exists(cwasm_path):
+        with contextlib.suppress(OSError, WasmtimeError):
+            return Module.deserialize_file(engine, cwasm_path)
+    module = Module(engine, wasm_bytes)
+    with contextlib.suppress(OSError, WasmtimeError):
+        atomic_write(cwasm_path, module.serialize())
+    return module
+
+
 def get_runtime(js_path: str) -> "_DeStringRuntime":
     """Return cached runtime for a deString.js path."""
     runtime = _RUNTIME_CACHE.get(js_path)
     if runtime is not None:
         return runtime
-    if Module is None or Store is None or Linker is None:
+    if Engine is None or Module is None or Store is None or Linker is None:
         raise RuntimeError(
             "python package 'wasmtime' is required to decode fliphtml5_pages"
         )
@@ -108,13 +220,22 @@ def get_runtime(js_path: str) -> "_DeStringRuntime":
     return runtime
 
 
+def _memory_address(memory, store) -> int:
+    """Return the current base address of a wasm memory.
+
+    The address moves when the memory grows, so it is looked up on each use.
+    """
+    return ctypes.addressof(memory.data_ptr(store).contents)
+
+
 class _DeStringRuntime:
     """Minimal WASM runtime wrapper for FlipHTML5 DeString."""
 
     def __init__(self, wasm_bytes: bytes) -> None:
-        store = Store()
-        module = Module(store.engine, wasm_bytes)
-        linker = Linker(store.engine)
+        engine = _engine()
+        store = Store(engine)
+        module = _load_module(engine, wasm_bytes)
+        linker = Linker(engine)
         self._define_imports(linker, module)
         instance = linker.instantiate(store, module)
         exports = instance.exports(store)
@@ -124,6 +245,8 @@ class _DeStringRuntime:
         self._malloc = exports["malloc"]
         self._free = exports["free"]
         self._destring = exports["DeString"]
+        self._buf_ptr = 0
+        self._buf_cap = 0
 
         exports["emscripten_stack_init"](store)
         exports["__wasm_call_ctors"](store)
@@ -182,8 +305,12 @@ class _DeStringRuntime:
         if size <= 0:
             return None
         memory = self._caller_memory(caller)
-        chunk = bytes(memory.read(caller, src, src + size))
-        memory.write(caller, chunk, dest)
+        mem_len = memory.data_len(caller)
+        if max(dest, src) + size > mem_len:
+            raise RuntimeError("emscripten_memcpy_big out of bounds")
+        # Copy inside wasm memory directly instead of via a Python bytes copy.
+        base = _memory_address(memory, caller)
+        ctypes.memmove(base + dest, base + src, size)
         return None
 
     def _fd_write(
@@ -191,15 +318,12 @@ class _DeStringRuntime:
     ) -> int:
         # wasm writes informational text to stdout/stderr; we ignore content.
         memory = self._caller_memory(caller)
-        total = 0
-        for i in range(iovs_len):
-            base = iovs + i * 8
-            chunk_len = int.from_bytes(
-                memory.read(caller, base + 4, base + 8),
-                "little",
-            )
-            total += chunk_len
-        memory.write(caller, total.to_bytes(4, "little"), nwritten)
+        # Read the whole iovec table at once; each entry is (ptr, len) u32 LE.
+        # read() clamps at the end of memory, so drop any partial entry.
+        table = memory.read(caller, iovs, iovs + iovs_len * 8)
+        del table[len(table) - len(table) % 8 :]
+        total = sum(length for _ptr, length in struct.iter_unpack("<II", table))
+        memory.write(caller, (total & 0xFFFFFFFF).to_bytes(4, "little"), nwritten)
         return 0
 
     def _emscripten_resize_heap(self, caller, requested_size: int) -> int:
@@ -218,14 +342,33 @@ class _DeStringRuntime:
 
     def decode(self, value: str) -> str:
         """Decode encrypted value and return raw decoded text."""
-        input_bytes = value.encode("utf-8") + b"\x00"
-        input_ptr = self._malloc(self._store, len(input_bytes))
-        try:
+        return self.decode_many([value])[0]
+
+    def decode_many(self, values: list[str]) -> list[str]:
+        """Decode several values, reusing one input buffer in wasm memory.
+
+        The buffer only grows, so repeated decodes do not malloc/free per value.
+        """
+        decoded = []
+        for value in values:
+            input_bytes = value.encode("utf-8") + b"\x00"
+            input_ptr = self._input_buffer(len(input_bytes))
             self._memory.write(self._store, input_bytes, input_ptr)
             output_ptr = self._destring(self._store, input_ptr)
-            return self._read_c_string(output_ptr)
-        finally:
-            self._free(self._store, input_ptr)
+            decoded.append(self._read_c_string(output_ptr))
+        return decoded
+
+    def _input_buffer(self, size: int) -> int:
+        if size > self._buf_cap:
+            if self._buf_ptr:
+                self._free(self._store, self._buf_ptr)
+                self._buf_ptr = self._buf_cap = 0
+            ptr = self._malloc(self._store, size)
+            if not ptr:
+                raise RuntimeError("deString malloc failed")
+            self._buf_ptr = ptr
+            self._buf_cap = size
+        return self._buf_ptr
 
     def _read_c_string(self, pointer: int) -> str:
         if pointer <= 0:
@@ -233,19 +376,29 @@ class _DeStringRuntime:
         mem_len = self._memory.data_len(self._store)
         if pointer >= mem_len:
             return ""
-        raw = bytes(self._memory.read(self._store, pointer, mem_len))
-        nul = raw.find(b"\x00")
-        if nul >= 0:
-            raw = raw[:nul]
+        # Scan forward in small chunks; the decoded text is far smaller than
+        # the heap behind it.
+        end = min(mem_len, pointer + C_STRING_MAX_LEN)
+        base = _memory_address(self._memory, self._store)
+        raw = bytearray()
+        for offset in range(pointer, end, C_STRING_SCAN_CHUNK):
+            chunk = ctypes.string_at(
+                base + offset, min(C_STRING_SCAN_CHUNK, end - offset)
+            )
+            nul = chunk.find(b"\x00")
+            if nul >= 0:
+                raw += chunk[:nul]
+                break
+            raw += chunk
         return raw.decode("utf-8", errors="replace")
 
 
 async def destring(value: str, session: aiohttp.ClientSession) -> str | None:
     """Decode encrypted text using FlipHTML5 deString WASM from Python."""
     try:
-        js_path = await ensure_destring_js(session)
+        runtime = await _runtime_for(session)
         loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, _decode_with_runtime, js_path, value)
+        return await loop.run_in_executor(_DESTRING_EXECUTOR, runtime.decode, value)
     except (
         aiohttp.ClientError,
         asyncio.TimeoutError,
@@ -0,0 +1,24 @@
+"""JSON helpers that use orjson when it is installed."""
+
+from __future__ import annotations
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib json fallback
+    orjson = None
+
+
+def loads(text: str | bytes):
+    """Parse JSON text; raises ``json.JSONDecodeError`` on invalid input."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def dumps_pretty(data) -> bytes:
+    """Serialize data as UTF-8 JSON indented by two spaces."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
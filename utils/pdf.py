@@ -2,9 +2,10 @@
 
 from __future__ import annotations
 
-import io
+import contextlib
 import os
 import threading
+from dataclasses import dataclass
 
 import img2pdf
 import pikepdf
@@ -12,52 +13,162 @@ from tqdm import tqdm
 
 from utils.text import short_label
 
+READY_POLL_INTERVAL = 0.2
+
 
 class PDFBuildCancelled(Exception):
     """Raised when PDF build is cancelled by user request."""
 
 
+@dataclass(slots=True)
+class _BuildProgress:
+    """Progress and cancellation state shared by page sources of one build.
+
+    The progress bar is created once ``show_event`` is set, so it does not
+    draw alongside the download bar while pages are still arriving.
+    """
+
+    total: int
+    cancel_event: threading.Event | None
+    show_event: threading.Event | None = None
+    current: str = "-"
+    done: int = 0
+    pbar: tqdm | None = None
+
+    def check_cancelled(self) -> None:
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise PDFBuildCancelled("PDF build cancelled")
+
+    def start_page(self, name: str) -> None:
+        self.current = name
+        pbar = self._visible_bar()
+        if pbar is not None:
+            pbar.set_description_str(short_label(name))
+
+    def finish_page(self) -> None:
+        self.done += 1
+        pbar = self._visible_bar()
+        if pbar is not None:
+            pbar.update(1)
+
+    def close(self) -> None:
+        if self.pbar is not None:
+            self.pbar.close()
+
+    def _visible_bar(self) -> tqdm | None:
+        if self.pbar is None and (self.show_event is None or self.show_event.is_set()):
+            self.pbar = tqdm(
+                total=self.total,
+                initial=self.done,
+                desc="pdf",
+                unit="page",
+                leave=False,
+            )
+        return self.pbar
+
+
+class _PageSource:
+    """File-like page image that img2pdf reads in page order."""
+
+    __slots__ = ("path", "progress", "ready")
+
+    def __init__(
+        self,
+        path: str,
+        progress: _BuildProgress,
+        ready: threading.Event | None = None,
+    ) -> None:
+        self.path = path
+        self.progress = progress
+        self.ready = ready
+
+    def read(self) -> bytes:
+        progress = self.progress
+        progress.check_cancelled()
+        progress.start_page(os.path.basename(self.path))
+        if self.ready is not None:
+            while not self.ready.wait(READY_POLL_INTERVAL):
+                progress.check_cancelled()
+        with open(self.path, "rb") as f:
+            data = f.read()
+        progress.finish_page()
+        return data
+
+
+class _CancellableWriter:
+    """Output stream wrapper that stops the PDF write once cancelled.
+
+    img2pdf reads every page before writing, so without this a cancel during
+    the write of a large book would only be noticed after it finished.
+    """
+
+    __slots__ = ("_stream", "_progress")
+
+    def __init__(self, stream, progress: _BuildProgress) -> None:
+        self._stream = stream
+        self._progress = progress
+
+    def write(self, data) -> int:
+        self._progress.check_cancelled()
+        return self._stream.write(data)
+
+    def __getattr__(self, name: str):
+        return getattr(self._stream, name)
+
+
 def build_pdf_from_images(
     image_paths: list[str],
     pdf_path: str,
     title: str | None,
     description: str | None,
     cancel_event: threading.Event | None = None,
+    page_ready: list[threading.Event] | None = None,
+    show_progress: threading.Event | None = None,
 ) -> None:
-    """Build a single PDF from image paths with per-page progress updates."""
+    """Build a single PDF from image paths with per-page progress updates.
+
+    When ``page_ready`` is given, each image is read only once its event is
+    set, so the build can run while pages are still being downloaded. The
+    progress bar stays hidden until ``show_progress`` is set, if given.
+    """
     if not image_paths:
         raise ValueError("No images to build PDF")
+    if page_ready is None:
+        ready_events = [None] * len(image_paths)
+    else:
+        ready_events = page_ready
 
     pdf_dir = os.path.dirname(pdf_path)
     if pdf_dir:
         os.makedirs(pdf_dir, exist_ok=True)
 
-    merged = pikepdf.Pdf.new()
+    tmp_path = f"{pdf_path}.part"
+    progress = _BuildProgress(len(image_paths), cancel_event, show_progress)
     try:
-        with tqdm(total=len(image_paths), desc="pdf", unit="page", leave=False) as pbar:
-            for image_path in image_paths:
-                if cancel_event is not None and cancel_event.is_set():
-                    raise PDFBuildCancelled("PDF build cancelled")
-                pbar.set_description_str(short_label(os.path.basename(image_path)))
-                try:
-                    page_pdf = img2pdf.convert(image_path)
-                    with pikepdf.open(io.BytesIO(page_pdf)) as one_page:
-                        merged.pages.extend(one_page.pages)
-                except (img2pdf.ImageOpenError, OSError, pikepdf.PdfError) as exc:
-                    name = os.path.basename(image_path)
-                    raise ValueError(
-                        f"failed to process image '{name}': {exc}"
-                    ) from exc
-                pbar.update(1)
-
-        if cancel_event is not None and cancel_event.is_set():
-            raise PDFBuildCancelled("PDF build cancelled")
-        if title:
-            merged.docinfo["/Title"] = title
-        if description:
-            merged.docinfo["/Subject"] = description
-        merged.save(pdf_path)
-    except pikepdf.PdfError as exc:
-        raise ValueError(str(exc)) from exc
-    finally:
-        merged.close()
+        sources = [
+            _PageSource(path, progress, ready)
+            for path, ready in zip(image_paths, ready_events, strict=True)
+        ]
+        try:
+            # One convert call embeds JPEGs as-is and writes /Title and
+            # /Subject in the same pass, streaming straight to the file.
+            with open(tmp_path, "wb") as f:
+                img2pdf.convert(
+                    sources,
+                    title=title,
+                    subject=description,
+                    outputstream=_CancellableWriter(f, progress),
+                )
+        except (img2pdf.ImageOpenError, OSError, pikepdf.PdfError) as exc:
+            raise ValueError(
+                f"failed to process image '{progress.current}': {exc}"
+            ) from exc
+        finally:
+            progress.close()
+
+        progress.check_cancelled()
+        os.replace(tmp_path, pdf_path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
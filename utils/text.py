@@ -2,18 +2,44 @@
 
 from __future__ import annotations
 
+import functools
+import re
+
+FILENAME_PUNCTUATION = frozenset(" -_.")
+BR_TAG_RE = re.compile(r"<br\s*/?>")
+
+
+class _FilenameTable(dict):
+    """``str.translate`` table that maps unsafe characters to ``_``.
+
+    Entries are filled in on first lookup, so each code point is classified
+    once per process.
+    """
+
+    def __missing__(self, codepoint: int) -> str:
+        ch = chr(codepoint)
+        value = ch if ch.isalnum() or ch in FILENAME_PUNCTUATION else "_"
+        self[codepoint] = value
+        return value
+
+
+_FILENAME_TABLE = _FilenameTable()
+_ASCII_FILENAME_TABLE = bytes(
+    c if c < 128 and (chr(c).isalnum() or chr(c) in FILENAME_PUNCTUATION) else ord("_")
+    for c in range(256)
+)
+
 
 def sanitize_filename(value: str | None) -> str:
     """Return a filesystem-friendly filename from a title."""
     if not value:
         return "book"
-    safe = []
-    for ch in value:
-        if ch.isalnum() or ch in (" ", "-", "_", "."):
-            safe.append(ch)
-        else:
-            safe.append("_")
-    name = "".join(safe).strip().replace(" ", "_")
+    if value.isascii():
+        # Most titles are ASCII; bytes.translate avoids per-character lookups.
+        name = value.encode("ascii").translate(_ASCII_FILENAME_TABLE).decode("ascii")
+    else:
+        name = value.translate(_FILENAME_TABLE)
+    name = name.strip().replace(" ", "_")
     return name or "book"
 
 
@@ -21,15 +47,19 @@ def clean_description(value: str | None, max_len: int | None = None) -> str:
     """Normalize description text and optionally truncate."""
     if not value:
         return ""
-    desc = value.replace("<br>", " ").replace("<br/>", " ").replace("\n", " ")
-    desc = " ".join(desc.split())
+    # split() already breaks on newlines, so only <br> tags need replacing.
+    desc = " ".join(BR_TAG_RE.sub(" ", value).split())
     if max_len is not None and len(desc) > max_len:
         desc = desc[: max_len - 3].rstrip() + "..."
     return desc
 
 
+@functools.lru_cache(maxsize=1024)
 def short_label(value: str | None, max_len: int = 36) -> str:
-    """Return a shortened label for progress display."""
+    """Return a shortened label for progress display.
+
+    Cached, since progress bars relabel with the same page names repeatedly.
+    """
     if not value:
         return "-"
     if len(value) <= max_len:
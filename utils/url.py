@@ -2,18 +2,22 @@
 
 from __future__ import annotations
 
-from urllib.parse import urlparse
+import re
+
+# Optional scheme, host, then the first two non-empty path segments. The
+# lookahead stops a failed match from retrying with "https:" as the host. The
+# book id ends at ";" so path parameters are not taken as part of it.
+SHARE_URL_RE = re.compile(r"(?:https?://|(?!https?://))[^/?#]*/+([^/?#]+)/+([^/?#;]+)")
+# Tabs and line breaks, e.g. from a pasted URL, are dropped like urlparse does.
+URL_NOISE = str.maketrans("", "", "\t\r\n")
 
 
 def normalize_share_url(url: str) -> str:
     """Convert a share URL into the FlipHTML5 reader base URL."""
-    if not url.startswith("http://") and not url.startswith("https://"):
-        url = "https://" + url
-    parsed = urlparse(url)
-    parts = [p for p in parsed.path.split("/") if p]
-    if len(parts) < 2:
+    match = SHARE_URL_RE.match(url.translate(URL_NOISE))
+    if match is None:
         raise ValueError(
             "URL path must contain at least two segments: /<publisher>/<book>/..."
         )
-    publisher, book = parts[0], parts[1]
+    publisher, book = match.groups()
     return f"https://online.fliphtml5.com/{publisher}/{book}/"